@@ -0,0 +1,134 @@
+import os
+import sys
+import time
+import sqlite3
+import pandas
+import utils
+import argparse
+
+class Catalog:
+  """
+  SQLite index of every episode written under outputs/, with its config hash, mode, wall time and headline metrics,
+  so that analysis tools can find and filter experiments without walking the tree and parsing each metrics file
+  """
+  COLUMNS = [
+    ('scenario', 'TEXT NOT NULL'),
+    ('run', 'INTEGER NOT NULL'),
+    ('episode', 'INTEGER NOT NULL'),
+    ('mode', 'TEXT NOT NULL'),
+    ('config_hash', 'TEXT NOT NULL'),
+    ('wall_time', 'REAL'),
+    ('recorded_at', 'REAL'),
+    ('metrics_file', 'TEXT'),
+    ('agents_dir', 'TEXT'),
+    ('truncated_at', 'REAL'),
+    ('window_begin', 'INTEGER'),
+    ('window_end', 'INTEGER'),
+    ('steps', 'INTEGER'),
+  ] + [(metric, 'REAL') for metric in utils.SUMMARY_METRICS]
+
+  def __init__(self, path: str) -> None:
+    self.connection: sqlite3.Connection = sqlite3.connect(path)
+    self.connection.execute("CREATE TABLE IF NOT EXISTS episodes (%s, PRIMARY KEY (scenario, run, episode, mode, config_hash))" % (
+      ", ".join(["%s %s" % column for column in Catalog.COLUMNS])
+    ))
+    self.connection.execute("""
+      CREATE VIEW IF NOT EXISTS runs AS
+      SELECT scenario, run, mode, config_hash, COUNT(*) AS episodes, SUM(wall_time) AS wall_time, MAX(recorded_at) AS recorded_at
+      FROM episodes GROUP BY scenario, run, mode, config_hash
+    """)
+    self.connection.commit()
+
+  def record_episode(self, scenario: utils.Scenario, run: int, episode: int, mode: str, wall_time: float|None,
+                     summary: dict[str, float], truncated_at: float|None = None, window_begin: int|None = None, window_end: int|None = None) -> None:
+    # a re-run with the same mode and config writes the same files, so it replaces its previous row
+    self.insert(dict(summary,
+      scenario=scenario.name,
+      run=run,
+      episode=episode,
+      mode=mode,
+      config_hash=scenario.config_hash(),
+      wall_time=wall_time,
+      recorded_at=time.time(),
+      metrics_file=os.path.normpath(scenario.metrics_file(run, episode, mode)),
+      agents_dir=os.path.normpath(scenario.agents_path(run, episode)) if mode == 'QL' else None,
+      truncated_at=truncated_at,
+      window_begin=window_begin,
+      window_end=window_end,
+    ), replace=True)
+
+  def insert(self, row: dict, replace: bool) -> None:
+    columns = [name for name, _ in Catalog.COLUMNS if name in row]
+    self.connection.execute("INSERT OR %s INTO episodes (%s) VALUES (%s)" % (
+      "REPLACE" if replace else "IGNORE", ", ".join(columns), ", ".join(["?"] * len(columns))
+    ), [row[column] for column in columns])
+    self.connection.commit()
+
+  def has_metrics_file(self, metrics_file: str) -> bool:
+    return self.connection.execute("SELECT 1 FROM episodes WHERE metrics_file = ?", [metrics_file]).fetchone() is not None
+
+  def query(self, table: str, **filters) -> pandas.DataFrame:
+    """
+    Rows of `table` (episodes or runs) whose columns equal the given non-None filters
+    """
+    filters = {column: value for column, value in filters.items() if value is not None}
+    where = " AND ".join(["%s = ?" % column for column in filters])
+    sql = "SELECT * FROM %s%s ORDER BY scenario, run" % (table, " WHERE " + where if where else "")
+    if table == "episodes":
+      sql += ", episode"
+    return pandas.read_sql_query(sql, self.connection, params=list(filters.values()))
+
+  def episodes(self, **filters) -> pandas.DataFrame:
+    return self.query("episodes", **filters)
+
+  def runs(self, **filters) -> pandas.DataFrame:
+    return self.query("runs", **filters)
+
+  def close(self) -> None:
+    self.connection.close()
+
+def index_outputs(catalog: Catalog, scenario: utils.Scenario) -> int:
+  """
+  Records the metrics files written before the catalog existed, directly under metrics/<run>, which are not catalogued yet.
+  Neither their mode nor the config they were produced with is known, so both are recorded as `unknown`.
+  """
+  metrics_root = "./outputs/%s/metrics" % scenario.name
+  if not os.path.exists(metrics_root):
+    return 0
+  indexed = 0
+  for run in sorted(os.listdir(metrics_root)):
+    for filename in sorted(os.listdir("%s/%s" % (metrics_root, run))):
+      if not filename.endswith(".csv") or not run.isdigit() or not filename[:-len(".csv")].isdigit():
+        continue
+      path = os.path.normpath("%s/%s/%s" % (metrics_root, run, filename))
+      if catalog.has_metrics_file(path):
+        continue
+      metrics = pandas.read_csv(path)
+      truncated_at = float(metrics['step'][metrics['truncated']].min()) if 'truncated' in metrics and metrics['truncated'].any() else None
+      window_begin, window_end = (int(metrics['window_begin'][0]), int(metrics['window_end'][0])) if 'window_begin' in metrics else (None, None)
+      catalog.insert(dict(utils.summarize_metrics(metrics),
+        scenario=scenario.name,
+        run=int(run),
+        episode=int(filename[:-len(".csv")]),
+        mode='unknown',
+        config_hash='unknown',
+        recorded_at=os.path.getmtime(path),
+        metrics_file=path,
+        truncated_at=truncated_at,
+        window_begin=window_begin,
+        window_end=window_end,
+      ), replace=False)
+      indexed += 1
+  return indexed
+
+if __name__ == "__main__":
+  cli = argparse.ArgumentParser(sys.argv[0])
+  cli.add_argument('-s', '--scenario', type=str, default='prism2', choices=['4x4', 'prism2', 'fiore'])
+  cli.add_argument('--index', action="store_true", default=False, help="Record the metrics files already in the outputs tree")
+  cli_args = cli.parse_args(sys.argv[1:])
+  scenario = utils.Scenario(cli_args.scenario)
+  catalog = Catalog(scenario.catalog_file())
+  if cli_args.index:
+    print("Indexed %s episodes" % index_outputs(catalog, scenario))
+  print(catalog.runs(scenario=scenario.name).to_string(index=False))
+  catalog.close()
@@ -0,0 +1,65 @@
+import os
+import json
+import hashlib
+
+def files_digest(paths: list[str]) -> str:
+  digest = hashlib.sha256()
+  for path in paths:
+    with open(path, "rb") as file:
+      digest.update(hashlib.sha256(file.read()).digest())
+  return digest.hexdigest()
+
+class EvaluationCache:
+  """
+  Summary metrics of evaluations, one JSON file per (scenario files, checkpoint, seed) key.
+  Hits refresh the modification time of their entry, so that beyond `max_entries` the least recently used ones are evicted.
+  """
+  def __init__(self, dir: str, max_entries: int) -> None:
+    self.dir: str = dir
+    self.max_entries: int = max_entries
+
+  @staticmethod
+  def key(scenario_digest: str, checkpoint_digest: str, seed: int) -> str:
+    return hashlib.sha256(("%s/%s/%s" % (scenario_digest, checkpoint_digest, seed)).encode()).hexdigest()
+
+  def entry_file(self, key: str) -> str:
+    return os.path.join(self.dir, "%s.json" % key)
+
+  def entries(self) -> list[str]:
+    return [os.path.join(self.dir, filename) for filename in os.listdir(self.dir) if filename.endswith(".json")]
+
+  def get(self, key: str) -> dict|None:
+    path = self.entry_file(key)
+    if not os.path.exists(path):
+      return None
+    with open(path, "r") as file:
+      entry = json.load(file)
+    os.utime(path)
+    return entry['summary']
+
+  def put(self, key: str, summary: dict, **details) -> None:
+    path = self.entry_file(key)
+    with open(path + ".tmp", "w") as file:
+      json.dump(dict(details, summary=summary), file)
+    os.replace(path + ".tmp", path)
+    self.evict()
+
+  def invalidate(self, key: str) -> bool:
+    path = self.entry_file(key)
+    if not os.path.exists(path):
+      return False
+    os.remove(path)
+    return True
+
+  def clear(self) -> int:
+    entries = self.entries()
+    for path in entries:
+      os.remove(path)
+    return len(entries)
+
+  def evict(self) -> int:
+    entries = sorted(self.entries(), key=os.path.getmtime)
+    evicted = entries[:max(len(entries) - self.max_entries, 0)]
+    for path in evicted:
+      os.remove(path)
+    return len(evicted)
@@ -0,0 +1,73 @@
+import os
+import sys
+import json
+import numpy
+import pandas
+import utils
+import argparse
+import evalcache
+
+if "SUMO_HOME" in os.environ:
+  tools = os.path.join(os.environ["SUMO_HOME"], "tools")
+  sys.path.append(tools)
+else:
+  sys.exit("Please declare the environment variable 'SUMO_HOME'")
+
+from sumo_rl.agents import QLAgent
+
+def greedy_action(agent: QLAgent, state: tuple) -> int:
+  # unseen states get the first phase, so that evaluations stay deterministic
+  if state not in agent.q_table:
+    return 0
+  return int(numpy.argmax(agent.q_table[state]))
+
+def evaluate(scenario: utils.Scenario, run: int, episode: int|None, seed: int, fixed: bool) -> dict[str, float]:
+  env = scenario.new_sumo_environment(fixed)
+  env.sumo_seed = seed
+  initial_states = env.reset()
+  ql_agents = {}
+  if not fixed:
+    for ts in env.ts_ids:
+      ql_agents[ts] = scenario.load_agent(env, run, ts, initial_states[ts], episode)
+  done = {"__all__": False}
+  while not done["__all__"]:
+    actions = {ts: greedy_action(agent, agent.state) for ts, agent in ql_agents.items()}
+    s, r, done, info = env.step(action=actions)
+    for agent_id in s.keys():
+      if agent_id in ql_agents:
+        ql_agents[agent_id].state = env.encode(s[agent_id], agent_id)
+  summary = utils.summarize_metrics(pandas.DataFrame(env.metrics))
+  env.close()
+  return summary
+
+if __name__ == "__main__":
+  cli = argparse.ArgumentParser(sys.argv[0])
+  cli.add_argument('-s', '--scenario', type=str, default='prism2', choices=['4x4', 'prism2', 'fiore'])
+  cli.add_argument('-f', '--fixed', action="store_true", default=False)
+  cli.add_argument('-r', '--run', type=int, default=0)
+  cli.add_argument('-e', '--episode', type=int, default=None, help="Episode checkpoint to evaluate, the final one if omitted")
+  cli.add_argument('--seed', type=int, default=None, help="SUMO seed, the one of config.yml if omitted")
+  cli.add_argument('--invalidate', action="store_true", default=False, help="Drop the cached result of this evaluation and run it again")
+  cli.add_argument('--clear-cache', action="store_true", default=False, help="Drop every cached evaluation of the scenario and exit")
+  cli_args = cli.parse_args(sys.argv[1:])
+  scenario = utils.Scenario(cli_args.scenario)
+  cache = evalcache.EvaluationCache(scenario.evaluations_dir(), scenario.config.evaluation.cache_size)
+  if cli_args.clear_cache:
+    print("Dropped %s cached evaluations" % cache.clear())
+    sys.exit(0)
+
+  seed = cli_args.seed if cli_args.seed is not None else scenario.config.sumo.sumo_seed
+  scenario_digest = evalcache.files_digest(scenario.scenario_files())
+  checkpoint_files = [] if cli_args.fixed else scenario.checkpoint_files(cli_args.run, cli_args.episode)
+  if not cli_args.fixed and len(checkpoint_files) == 0:
+    sys.exit("No checkpoint for run %s / episode %s" % (cli_args.run, cli_args.episode))
+  checkpoint_digest = "fixed" if cli_args.fixed else evalcache.files_digest(checkpoint_files)
+  key = evalcache.EvaluationCache.key(scenario_digest, checkpoint_digest, seed)
+  if cli_args.invalidate:
+    cache.invalidate(key)
+
+  summary = cache.get(key)
+  if summary is None:
+    summary = evaluate(scenario, cli_args.run, cli_args.episode, seed, cli_args.fixed)
+    cache.put(key, summary, scenario=scenario_digest, checkpoint=checkpoint_digest, seed=seed)
+  print(json.dumps(summary, indent=2))
@@ -0,0 +1,36 @@
+import collections
+
+class GridlockMonitor:
+  """
+  Watches the system metrics of an episode and reports a gridlock once, over the last `window` steps,
+  at least `min_stopped` vehicles were stopped, their number varied by at most `tolerance`
+  and the mean speed never exceeded `max_mean_speed`
+  """
+  def __init__(self, window: int, tolerance: int, min_stopped: int, max_mean_speed: float) -> None:
+    self.window: int = window
+    self.tolerance: int = tolerance
+    self.min_stopped: int = min_stopped
+    self.max_mean_speed: float = max_mean_speed
+    self.reset()
+
+  def reset(self) -> None:
+    self.stopped: collections.deque[int] = collections.deque(maxlen=self.window)
+    self.speeds: collections.deque[float] = collections.deque(maxlen=self.window)
+    self.truncated_at: float|None = None
+
+  def update(self, info: dict) -> bool:
+    self.stopped.append(info['system_total_stopped'])
+    self.speeds.append(info['system_mean_speed'])
+    if self.gridlocked():
+      self.truncated_at = info['step']
+      return True
+    return False
+
+  def gridlocked(self) -> bool:
+    if len(self.stopped) < self.window:
+      return False
+    return (
+      min(self.stopped) >= self.min_stopped and
+      max(self.stopped) - min(self.stopped) <= self.tolerance and
+      max(self.speeds) <= self.max_mean_speed
+    )
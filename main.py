@@ -1,9 +1,13 @@
 import os
 import sys
+import time
 import pickle
 import pandas
 import utils
 import argparse
+import transitions
+import qtable
+import catalog
 
 if "SUMO_HOME" in os.environ:
   tools = os.path.join(os.environ["SUMO_HOME"], "tools")
@@ -21,13 +25,29 @@ if __name__ == "__main__":
   cli = argparse.ArgumentParser(sys.argv[0])
   cli.add_argument('-s', '--scenario', type=str, default='prism2', choices=['4x4', 'prism2', 'fiore'])
   cli.add_argument('-f', '--fixed', action="store_true", default=False)
+  cli.add_argument('-g', '--gridlock', action="store_true", default=False, help="End episodes early once the network is gridlocked")
+  cli.add_argument('-w', '--windows', action="store_true", default=False, help="Train on windows sampled across the demand profile instead of whole simulations")
+  cli.add_argument('-t', '--record', action="store_true", default=False, help="Record the transitions fed to the agents")
+  cli.add_argument('--fresh-record', action="store_true", default=False, help="Discard the transitions recorded by previous invocations instead of appending to them")
   cli_args = cli.parse_args(sys.argv[1:])
   scenario = utils.Scenario(cli_args.scenario)
 
   env = scenario.new_sumo_environment(cli_args.fixed)
+  monitor = scenario.new_gridlock_monitor() if cli_args.gridlock else None
+  windows = scenario.new_demand_windows() if cli_args.windows else None
+  experiments = catalog.Catalog(scenario.catalog_file())
+  mode = 'fixed' if cli_args.fixed else 'QL'
   for run in range(scenario.config.training.runs):
+    started_at = time.time()
+    window = None
+    if windows is not None:
+      window = windows.sample(0)
+      window.apply(env)
     initial_states = env.reset()
     ql_agents = {}
+    recorder = None
+    if cli_args.record and not cli_args.fixed:
+      recorder = transitions.TransitionRecorder(scenario.transitions_dir(run), scenario.config.recording.capacity, cli_args.fresh_record)
     if not cli_args.fixed:
       for ts in env.ts_ids:
         if RECICLE:
@@ -37,32 +57,75 @@ if __name__ == "__main__":
 
     for episode in range(scenario.config.training.episodes):
       if episode != 0:
+        started_at = time.time()
         env.sumo_seed = int(env.sumo_seed) + 1
+        if windows is not None:
+          window = windows.sample(episode)
+          window.apply(env)
         initial_states = env.reset()
         if not cli_args.fixed:
           for ts in initial_states.keys():
             ql_agents[ts].state = env.encode(initial_states[ts], ts)
+            scenario.ensure_state(ql_agents[ts])
 
       done = {"__all__": False}
+      if monitor is not None:
+        monitor.reset()
       while not done["__all__"]:
         if not cli_args.fixed:
           actions = {ts: ql_agents[ts].act() for ts in ql_agents.keys()}
           s, r, done, info = env.step(action=actions)
-          for agent_id in s.keys():
-            ql_agents[agent_id].learn(next_state=env.encode(s[agent_id], agent_id), reward=r[agent_id])
         else:
           s, r, done, info = env.step(action={})
+        truncated = monitor is not None and monitor.update(info)
+        if not cli_args.fixed:
+          for agent_id in s.keys():
+            agent = ql_agents[agent_id]
+            next_state = env.encode(s[agent_id], agent_id)
+            reward = r[agent_id]
+            if truncated:
+              reward += scenario.config.gridlock.penalty
+            if recorder is not None:
+              recorder.record(agent_id, agent.state, agent.action, reward, next_state, agent.action_space.n, truncated)
+            qtable.visit(agent.q_table, next_state)
+            if truncated:
+              utils.learn_terminal(agent, next_state, reward)
+            else:
+              agent.learn(next_state=next_state, reward=reward)
+        if truncated:
+          print("Run %s / episode %s: gridlock detected at step %s, ending episode" % (run, episode, monitor.truncated_at))
+          break
 
-      path = scenario.metrics_file(run, episode)
-      pandas.DataFrame(env.metrics).to_csv(path, index=False)
+      path = scenario.metrics_file(run, episode, mode)
+      metrics = pandas.DataFrame(env.metrics)
+      print("Run %s / episode %s: %.1f TraCI calls per step" % (run, episode, metrics['traci_calls'].mean()))
+      if window is not None:
+        metrics['window_regime'] = window.regime
+        metrics['window_begin'] = window.begin
+        metrics['window_end'] = window.end
+      if monitor is not None:
+        metrics['truncated'] = metrics['step'] == monitor.truncated_at
+      metrics.to_csv(path, index=False)
+      if recorder is not None:
+        recorder.flush()
       if not cli_args.fixed:
         for ts, agent in ql_agents.items():
+          if scenario.config.q_table.compact:
+            dropped = scenario.shrink_q_table(agent)
+            usage = qtable.memory_usage(agent.q_table)
+            print("Run %s / episode %s: agent %s holds %s states in %s bytes, %s allocated (%s pruned)" % (
+              run, episode, ts, usage['states'], usage['used_bytes'], usage['total_bytes'], dropped))
           path = scenario.agents_file(run, episode, ts)
           with open(path, "wb") as file:
             pickle.dump(agent.q_table, file)
+      experiments.record_episode(scenario, run, episode, mode, time.time() - started_at, utils.summarize_metrics(metrics),
+                                 truncated_at=monitor.truncated_at if monitor is not None else None,
+                                 window_begin=window.begin if window is not None else None,
+                                 window_end=window.end if window is not None else None)
     if not cli_args.fixed:
       for ts, agent in ql_agents.items():
         path = scenario.agents_file(run, None, ts)
         with open(path, "wb") as file:
           pickle.dump(agent.q_table, file)
   env.close()
+  experiments.close()
@@ -2,44 +2,60 @@ import pandas
 import matplotlib.pyplot
 import utils
 import argparse
+import catalog
 import sys
 
-def load_metrics(scenario: utils.Scenario) -> dict[int, dict[int, pandas.DataFrame]]:
+def load_metrics(episodes: pandas.DataFrame) -> dict[str, dict[int, dict[int, pandas.DataFrame]]]:
   metrics = {}
-  for run in range(scenario.config.training.runs):
-    metrics[run] = {}
-    for episode in range(scenario.config.training.episodes):
-      metrics[run][episode] = pandas.read_csv(scenario.metrics_file(run, episode))
+  for row in episodes.itertuples():
+    experiment = utils.experiment_name(row.mode, row.config_hash)
+    if experiment not in metrics:
+      metrics[experiment] = {}
+    if row.run not in metrics[experiment]:
+      metrics[experiment][row.run] = {}
+    metrics[experiment][row.run][row.episode] = pandas.read_csv(row.metrics_file)
   return metrics
 
-def plot_single_metrics(metrics: dict[int, dict[int, pandas.DataFrame]]):
+def plot_single_metrics(metrics: dict[str, dict[int, dict[int, pandas.DataFrame]]]):
   metric = ''
-  for run in metrics:
-    for episode in metrics[run]:
-      df = metrics[run][episode]
-      figure = matplotlib.pyplot.figure(figsize=(20, 10))
-      matplotlib.pyplot.plot(df['step'], df['system_mean_waiting_time'], marker='o')
-      matplotlib.pyplot.title('Metric %s for run %s / episode %s' % (metric, run, episode))
-      matplotlib.pyplot.savefig(scenario.plots_file(run, episode))
+  for experiment in metrics:
+    for run in metrics[experiment]:
+      for episode in metrics[experiment][run]:
+        df = metrics[experiment][run][episode]
+        figure = matplotlib.pyplot.figure(figsize=(20, 10))
+        matplotlib.pyplot.plot(df['step'], df['system_mean_waiting_time'], marker='o')
+        matplotlib.pyplot.title('Metric %s for %s run %s / episode %s' % (metric, experiment, run, episode))
+        matplotlib.pyplot.savefig(scenario.plots_file(run, experiment, episode))
 
-def plot_summary_metrics(metrics: dict[int, dict[int, pandas.DataFrame]]):
+def plot_summary_metrics(metrics: dict[str, dict[int, dict[int, pandas.DataFrame]]]):
   metric = ''
-  for run in metrics:
-    figure = matplotlib.pyplot.figure(figsize=(20, 10))
-    Ys = []
-    for episode in metrics[run]:
-      df = metrics[run][episode]
-      Ys += list(df['system_mean_waiting_time'])
-    Xs = [_ for _ in range(len(Ys))]
-    matplotlib.pyplot.plot(Xs, Ys, marker='o')
-    matplotlib.pyplot.title('Metric %s for run %s' % (metric, run))
-    matplotlib.pyplot.savefig(scenario.plots_file(run, None))
+  for experiment in metrics:
+    for run in metrics[experiment]:
+      figure = matplotlib.pyplot.figure(figsize=(20, 10))
+      Ys = []
+      for episode in metrics[experiment][run]:
+        df = metrics[experiment][run][episode]
+        Ys += list(df['system_mean_waiting_time'])
+      Xs = [_ for _ in range(len(Ys))]
+      matplotlib.pyplot.plot(Xs, Ys, marker='o')
+      matplotlib.pyplot.title('Metric %s for %s run %s' % (metric, experiment, run))
+      matplotlib.pyplot.savefig(scenario.plots_file(run, experiment, None))
 
 if __name__ == "__main__":
   cli = argparse.ArgumentParser(sys.argv[0])
   cli.add_argument('-s', '--scenario', type=str, default='prism2', choices=['4x4', 'prism2', 'fiore'])
+  cli.add_argument('-r', '--run', type=int, default=None)
+  cli.add_argument('-m', '--mode', type=str, default=None, choices=['QL', 'fixed', 'unknown'])
+  cli.add_argument('-c', '--config-hash', type=str, default=None)
+  cli.add_argument('-l', '--list', action="store_true", default=False, help="Only list the matching episodes recorded in the catalog")
   cli_args = cli.parse_args(sys.argv[1:])
   scenario = utils.Scenario(cli_args.scenario)
-  metrics = load_metrics(scenario)
+  experiments = catalog.Catalog(scenario.catalog_file())
+  episodes = experiments.episodes(scenario=scenario.name, run=cli_args.run, mode=cli_args.mode, config_hash=cli_args.config_hash)
+  experiments.close()
+  if cli_args.list:
+    print(episodes.drop(columns=['scenario', 'metrics_file', 'agents_dir']).to_string(index=False))
+    sys.exit(0)
+  metrics = load_metrics(episodes)
   plot_single_metrics(metrics)
   plot_summary_metrics(metrics)
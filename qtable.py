@@ -0,0 +1,192 @@
+import sys
+import collections.abc
+import numpy
+
+class CompactQTable(collections.abc.MutableMapping):
+  """
+  Drop-in replacement for the dict of lists used as q_table by QLAgent.
+  Discretized states are packed into a single integer key (`bits` bits per component) and the action values
+  of all states live in one contiguous float array: rows are returned as views, so `q_table[state][action] = value`
+  writes through exactly like it does on a list.
+  """
+  def __init__(self, n_actions: int, bits: int = 4, capacity: int = 1024) -> None:
+    self.n_actions: int = n_actions
+    self.bits: int = bits
+    self.width: int|None = None
+    self.size: int = 0
+    self.values: numpy.ndarray = numpy.zeros((capacity, n_actions), dtype=numpy.float64)
+    self.visits: numpy.ndarray = numpy.zeros(capacity, dtype=numpy.uint32)
+    self.row_keys: list[int] = []
+    self.index: dict[int, int] = {}
+
+  @staticmethod
+  def from_dict(q_table: dict, bits: int = 4) -> 'CompactQTable':
+    n_actions = len(next(iter(q_table.values())))
+    compact = CompactQTable(n_actions, bits, max(len(q_table), 1))
+    for state, values in q_table.items():
+      compact[state] = values
+    return compact
+
+  def pack(self, state: tuple) -> int:
+    if self.width is None:
+      self.width = len(state)
+    elif len(state) != self.width:
+      raise ValueError("State %s has %s components, expected %s" % (state, len(state), self.width))
+    key = 0
+    for component in state:
+      component = int(component)
+      if component < 0 or component >> self.bits:
+        raise ValueError("State component %s of %s does not fit in %s bits" % (component, state, self.bits))
+      key = (key << self.bits) | component
+    return key
+
+  def unpack(self, key: int) -> tuple:
+    mask = (1 << self.bits) - 1
+    return tuple((key >> (self.bits * (self.width - 1 - i))) & mask for i in range(self.width))
+
+  def grow(self) -> None:
+    capacity = max(2 * len(self.visits), 1)
+    values = numpy.zeros((capacity, self.n_actions), dtype=numpy.float64)
+    values[:self.size] = self.values[:self.size]
+    visits = numpy.zeros(capacity, dtype=numpy.uint32)
+    visits[:self.size] = self.visits[:self.size]
+    self.values, self.visits = values, visits
+
+  def __getitem__(self, state: tuple) -> numpy.ndarray:
+    row = self.index.get(self.pack(state))
+    if row is None:
+      raise KeyError(state)
+    return self.values[row]
+
+  def __setitem__(self, state: tuple, values) -> None:
+    key = self.pack(state)
+    row = self.index.get(key)
+    if row is None:
+      if self.size == len(self.visits):
+        self.grow()
+      row = self.size
+      self.size += 1
+      self.index[key] = row
+      self.row_keys.append(key)
+      # states are inserted when first reached, which counts as their first visit
+      self.visits[row] = 1
+    self.values[row] = values
+
+  def __delitem__(self, state: tuple) -> None:
+    key = self.pack(state)
+    row = self.index.pop(key)
+    last = self.size - 1
+    if row != last:
+      self.values[row] = self.values[last]
+      self.visits[row] = self.visits[last]
+      self.row_keys[row] = self.row_keys[last]
+      self.index[self.row_keys[row]] = row
+    self.row_keys.pop()
+    self.size -= 1
+
+  def __contains__(self, state) -> bool:
+    return self.pack(state) in self.index
+
+  def visit(self, state: tuple) -> bool:
+    """
+    Counts a visit to `state` if it is already in the table; returns whether it was
+    """
+    row = self.index.get(self.pack(state))
+    if row is None:
+      return False
+    self.visits[row] += 1
+    return True
+
+  def __iter__(self):
+    for key in self.row_keys:
+      yield self.unpack(key)
+
+  def __len__(self) -> int:
+    return self.size
+
+  def retain(self, rows: numpy.ndarray) -> None:
+    self.values[:len(rows)] = self.values[rows]
+    self.visits[:len(rows)] = self.visits[rows]
+    self.row_keys = [self.row_keys[row] for row in rows]
+    self.index = {key: row for row, key in enumerate(self.row_keys)}
+    self.size = len(rows)
+
+  def kept_rows(self, keep: tuple) -> numpy.ndarray:
+    mask = numpy.zeros(self.size, dtype=bool)
+    for state in keep:
+      row = self.index.get(self.pack(state))
+      if row is not None:
+        mask[row] = True
+    return mask
+
+  def prune(self, min_visits: int, keep: tuple = ()) -> int:
+    """
+    Drops the states visited less than `min_visits` times, except the ones in `keep`; returns how many were dropped
+    """
+    size = self.size
+    mask = (self.visits[:self.size] >= min_visits) | self.kept_rows(keep)
+    self.retain(numpy.flatnonzero(mask))
+    return size - self.size
+
+  def evict(self, max_states: int, keep: tuple = ()) -> int:
+    """
+    Keeps only the `max_states` most visited states plus the ones in `keep`; returns how many were dropped
+    """
+    size = self.size
+    if self.size <= max_states:
+      return 0
+    mask = self.kept_rows(keep)
+    mask[numpy.argsort(-self.visits[:self.size].astype(numpy.int64), kind='stable')[:max_states]] = True
+    self.retain(numpy.flatnonzero(mask))
+    return size - self.size
+
+  def memory_usage(self) -> dict[str, int]:
+    """
+    Bytes allocated by the table; `used_bytes` leaves out the rows reserved by grow() and not filled yet
+    """
+    values = self.values.nbytes
+    visits = self.visits.nbytes
+    index = sys.getsizeof(self.index) + sys.getsizeof(self.row_keys) + sum(sys.getsizeof(key) for key in self.row_keys)
+    return {
+      'states': self.size,
+      'capacity': len(self.visits),
+      'values_bytes': values,
+      'visits_bytes': visits,
+      'index_bytes': index,
+      'used_bytes': self.values[:self.size].nbytes + self.visits[:self.size].nbytes + index,
+      'total_bytes': values + visits + index,
+    }
+
+  def __getstate__(self) -> dict:
+    state = self.__dict__.copy()
+    state['values'] = self.values[:self.size].copy()
+    state['visits'] = self.visits[:self.size].copy()
+    if self.width is not None and self.width * self.bits <= 64:
+      state['row_keys'] = numpy.array(self.row_keys, dtype=numpy.uint64)
+    del state['index']
+    return state
+
+  def __setstate__(self, state: dict) -> None:
+    self.__dict__.update(state)
+    if isinstance(self.row_keys, numpy.ndarray):
+      self.row_keys = self.row_keys.tolist()
+    self.index = {key: row for row, key in enumerate(self.row_keys)}
+
+def visit(q_table: dict|CompactQTable, state: tuple) -> None:
+  """
+  Counts a visit to `state`, must be called once per transition before the agent learns it; plain dicts keep no counts
+  """
+  if isinstance(q_table, CompactQTable):
+    q_table.visit(state)
+
+def memory_usage(q_table: dict|CompactQTable) -> dict[str, int]:
+  """
+  Memory report of either kind of q_table, so that plain dicts can be compared with compact tables
+  """
+  if isinstance(q_table, CompactQTable):
+    return q_table.memory_usage()
+  total = sys.getsizeof(q_table)
+  for state, values in q_table.items():
+    total += sys.getsizeof(state) + sum(sys.getsizeof(c) for c in state)
+    total += sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values)
+  return {'states': len(q_table), 'total_bytes': total}
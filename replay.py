@@ -0,0 +1,61 @@
+import os
+import sys
+import pickle
+import utils
+import argparse
+import transitions
+
+if "SUMO_HOME" in os.environ:
+  tools = os.path.join(os.environ["SUMO_HOME"], "tools")
+  sys.path.append(tools)
+else:
+  sys.exit("Please declare the environment variable 'SUMO_HOME'")
+
+from sumo_rl.agents import QLAgent
+
+def replay(agent: QLAgent, log: transitions.TransitionLog) -> None:
+  data = log.transitions()
+  states = list(map(tuple, data['state'].tolist()))
+  actions = data['action'].tolist()
+  rewards = data['reward'].tolist()
+  next_states = list(map(tuple, data['next_state'].tolist()))
+  dones = data['done'].tolist()
+  q_table = agent.q_table
+  n_actions = agent.action_space.n
+  for state, action, reward, next_state, done in zip(states, actions, rewards, next_states, dones):
+    # the ring buffer may have overwritten the transition that led into this state
+    if state not in q_table:
+      q_table[state] = [0 for _ in range(n_actions)]
+    agent.state = state
+    agent.action = action
+    if done:
+      utils.learn_terminal(agent, next_state, reward)
+    else:
+      agent.learn(next_state=next_state, reward=reward)
+
+if __name__ == "__main__":
+  cli = argparse.ArgumentParser(sys.argv[0])
+  cli.add_argument('-s', '--scenario', type=str, default='prism2', choices=['4x4', 'prism2', 'fiore'])
+  cli.add_argument('-r', '--run', type=int, default=0, help="Run whose recorded transitions are replayed")
+  cli.add_argument('-a', '--alpha', type=float, default=None)
+  cli.add_argument('-g', '--gamma', type=float, default=None)
+  cli.add_argument('-e', '--epochs', type=int, default=1, help="Number of passes over the recorded transitions")
+  cli_args = cli.parse_args(sys.argv[1:])
+  scenario = utils.Scenario(cli_args.scenario)
+  if cli_args.alpha is not None:
+    scenario.config.agent.alpha = cli_args.alpha
+  if cli_args.gamma is not None:
+    scenario.config.agent.gamma = cli_args.gamma
+
+  dir = scenario.transitions_dir(cli_args.run)
+  for ts in transitions.list_logs(dir):
+    log = transitions.TransitionLog(os.path.join(dir, ts))
+    if len(log) == 0:
+      continue
+    agent = scenario.new_offline_agent(tuple(log.transitions()['state'][0].tolist()), log.n_actions())
+    for epoch in range(cli_args.epochs):
+      replay(agent, log)
+    path = scenario.agents_file(cli_args.run, "offline", ts)
+    with open(path, "wb") as file:
+      pickle.dump(agent.q_table, file)
+    print("%s: replayed %s transitions %s times into %s" % (ts, len(log), cli_args.epochs, path))
@@ -0,0 +1,197 @@
+import numpy
+import traci.constants as tc
+
+from sumo_rl import SumoEnvironment
+from sumo_rl.environment.observations import DefaultObservationFunction
+from sumo_rl.environment.traffic_signal import TrafficSignal
+
+SIMULATION_VARIABLES = [tc.VAR_TIME, tc.VAR_DEPARTED_VEHICLES_IDS]
+LANE_VARIABLES = [tc.LAST_STEP_VEHICLE_NUMBER, tc.LAST_STEP_VEHICLE_HALTING_NUMBER, tc.LAST_STEP_LENGTH, tc.LAST_STEP_VEHICLE_ID_LIST]
+VEHICLE_VARIABLES = [tc.VAR_SPEED, tc.VAR_WAITING_TIME, tc.VAR_ACCUMULATED_WAITING_TIME, tc.VAR_LANE_ID, tc.VAR_ALLOWED_SPEED]
+
+class TraCICallCounter:
+  """
+  Counts the commands sent through a TraCI connection, each one being a socket round-trip.
+  libsumo has no socket, so nothing is counted there.
+  """
+  def __init__(self, sumo) -> None:
+    self.calls: int = 0
+    self.enabled: bool = hasattr(sumo, "_sendCmd")
+    if self.enabled:
+      send = sumo._sendCmd
+      def counted_send(*args, **kwargs):
+        self.calls += 1
+        return send(*args, **kwargs)
+      sumo._sendCmd = counted_send
+
+  def take(self) -> int|None:
+    if not self.enabled:
+      return None
+    calls, self.calls = self.calls, 0
+    return calls
+
+class SubscriptionLayer:
+  """
+  Subscribes once to the simulation, lane and vehicle variables needed by observations, rewards and metrics,
+  so that every step all of them come back batched in the answer to simulationStep.
+  Lanes are subscribed the first time they are read, vehicles as soon as they depart.
+  """
+  def __init__(self, sumo) -> None:
+    self.sumo = sumo
+    self.sumo.simulation.subscribe(SIMULATION_VARIABLES)
+    for vehicle in self.sumo.vehicle.getIDList():
+      self.sumo.vehicle.subscribe(vehicle, VEHICLE_VARIABLES)
+    self.simulation_results: dict = self.sumo.simulation.getSubscriptionResults()
+    self.lane_results: dict = self.sumo.lane.getAllSubscriptionResults()
+    self.vehicle_results: dict = self.sumo.vehicle.getAllSubscriptionResults()
+
+  def refresh(self) -> None:
+    """
+    Must be called after every simulation step
+    """
+    self.simulation_results = self.sumo.simulation.getSubscriptionResults()
+    for vehicle in self.simulation_results[tc.VAR_DEPARTED_VEHICLES_IDS]:
+      self.sumo.vehicle.subscribe(vehicle, VEHICLE_VARIABLES)
+    self.lane_results = self.sumo.lane.getAllSubscriptionResults()
+    self.vehicle_results = self.sumo.vehicle.getAllSubscriptionResults()
+
+  def time(self) -> float:
+    return self.simulation_results[tc.VAR_TIME]
+
+  def lane(self, lane_id: str) -> dict:
+    if lane_id not in self.lane_results:
+      self.sumo.lane.subscribe(lane_id, LANE_VARIABLES)
+      self.lane_results = self.sumo.lane.getAllSubscriptionResults()
+    return self.lane_results[lane_id]
+
+  def vehicle(self, vehicle_id: str) -> dict:
+    if vehicle_id not in self.vehicle_results:
+      self.sumo.vehicle.subscribe(vehicle_id, VEHICLE_VARIABLES)
+      self.vehicle_results = self.sumo.vehicle.getAllSubscriptionResults()
+    return self.vehicle_results[vehicle_id]
+
+  def vehicles(self) -> dict[str, dict]:
+    return self.vehicle_results
+
+  # The following mirror the getters of sumo_rl.environment.traffic_signal.TrafficSignal
+
+  def lanes_occupancy(self, ts: TrafficSignal, variable: int) -> list[float]:
+    occupancy = []
+    for lane in ts.lanes:
+      results = self.lane(lane)
+      occupancy.append(min(1, results[variable] / (ts.lanes_length[lane] / (ts.MIN_GAP + results[tc.LAST_STEP_LENGTH]))))
+    return occupancy
+
+  def lanes_density(self, ts: TrafficSignal) -> list[float]:
+    return self.lanes_occupancy(ts, tc.LAST_STEP_VEHICLE_NUMBER)
+
+  def lanes_queue(self, ts: TrafficSignal) -> list[float]:
+    return self.lanes_occupancy(ts, tc.LAST_STEP_VEHICLE_HALTING_NUMBER)
+
+  def total_queued(self, ts: TrafficSignal) -> int:
+    return sum(self.lane(lane)[tc.LAST_STEP_VEHICLE_HALTING_NUMBER] for lane in ts.lanes)
+
+  def accumulated_waiting_time_per_lane(self, ts: TrafficSignal) -> list[float]:
+    wait_time_per_lane = []
+    for lane in ts.lanes:
+      wait_time = 0.0
+      for veh in self.lane(lane)[tc.LAST_STEP_VEHICLE_ID_LIST]:
+        results = self.vehicle(veh)
+        veh_lane = results[tc.VAR_LANE_ID]
+        acc = results[tc.VAR_ACCUMULATED_WAITING_TIME]
+        if veh not in ts.env.vehicles:
+          ts.env.vehicles[veh] = {veh_lane: acc}
+        else:
+          ts.env.vehicles[veh][veh_lane] = acc - sum(
+            [ts.env.vehicles[veh][other] for other in ts.env.vehicles[veh].keys() if other != veh_lane]
+          )
+        wait_time += ts.env.vehicles[veh][veh_lane]
+      wait_time_per_lane.append(wait_time)
+    return wait_time_per_lane
+
+  def average_speed(self, ts: TrafficSignal) -> float:
+    vehs = [veh for lane in ts.lanes for veh in self.lane(lane)[tc.LAST_STEP_VEHICLE_ID_LIST]]
+    if len(vehs) == 0:
+      return 1.0
+    avg_speed = 0.0
+    for veh in vehs:
+      results = self.vehicle(veh)
+      avg_speed += results[tc.VAR_SPEED] / results[tc.VAR_ALLOWED_SPEED]
+    return avg_speed / len(vehs)
+
+class SubscribedObservationFunction(DefaultObservationFunction):
+  def __call__(self) -> numpy.ndarray:
+    subscriptions: SubscriptionLayer = self.ts.env.subscriptions
+    phase_id = [1 if self.ts.green_phase == i else 0 for i in range(self.ts.num_green_phases)]
+    min_green = [0 if self.ts.time_since_last_phase_change < self.ts.min_green + self.ts.yellow_time else 1]
+    density = subscriptions.lanes_density(self.ts)
+    queue = subscriptions.lanes_queue(self.ts)
+    return numpy.array(phase_id + min_green + density + queue, dtype=numpy.float32)
+
+def diff_waiting_time_reward(ts: TrafficSignal) -> float:
+  ts_wait = sum(ts.env.subscriptions.accumulated_waiting_time_per_lane(ts)) / 100.0
+  reward = ts.last_measure - ts_wait
+  ts.last_measure = ts_wait
+  return reward
+
+class CountedSumoEnvironment(SumoEnvironment):
+  """
+  SumoEnvironment whose metrics gain a `traci_calls` column with the TraCI commands issued since the previous step
+  """
+  def __init__(self, **kwargs) -> None:
+    self.counter: TraCICallCounter|None = None
+    super().__init__(**kwargs)
+
+  def _start_simulation(self) -> None:
+    super()._start_simulation()
+    self.counter = TraCICallCounter(self.sumo)
+
+  def _compute_info(self) -> dict:
+    info = super()._compute_info()
+    info["traci_calls"] = self.metrics[-1]["traci_calls"] = self.counter.take()
+    return info
+
+class SubscribedSumoEnvironment(CountedSumoEnvironment):
+  """
+  SumoEnvironment whose observations, rewards and metrics are read from a SubscriptionLayer instead of per-lane and per-vehicle getters
+  """
+  def __init__(self, **kwargs) -> None:
+    self.subscriptions: SubscriptionLayer|None = None
+    super().__init__(observation_class=SubscribedObservationFunction, reward_fn=diff_waiting_time_reward, **kwargs)
+
+  def _start_simulation(self) -> None:
+    super()._start_simulation()
+    self.subscriptions = SubscriptionLayer(self.sumo)
+
+  def _sumo_step(self) -> None:
+    super()._sumo_step()
+    self.subscriptions.refresh()
+
+  @property
+  def sim_step(self) -> float:
+    return self.subscriptions.time()
+
+  def _get_system_info(self) -> dict:
+    vehicles = self.subscriptions.vehicles().values()
+    speeds = [results[tc.VAR_SPEED] for results in vehicles]
+    waiting_times = [results[tc.VAR_WAITING_TIME] for results in vehicles]
+    return {
+      "system_total_stopped": sum(int(speed < 0.1) for speed in speeds),
+      "system_total_waiting_time": sum(waiting_times),
+      "system_mean_waiting_time": 0.0 if len(vehicles) == 0 else numpy.mean(waiting_times),
+      "system_mean_speed": 0.0 if len(vehicles) == 0 else numpy.mean(speeds),
+    }
+
+  def _get_per_agent_info(self) -> dict:
+    traffic_signals = [self.traffic_signals[ts] for ts in self.ts_ids]
+    stopped = [self.subscriptions.total_queued(ts) for ts in traffic_signals]
+    accumulated_waiting_time = [sum(self.subscriptions.accumulated_waiting_time_per_lane(ts)) for ts in traffic_signals]
+    average_speed = [self.subscriptions.average_speed(ts) for ts in traffic_signals]
+    info = {}
+    for i, ts in enumerate(self.ts_ids):
+      info["%s_stopped" % ts] = stopped[i]
+      info["%s_accumulated_waiting_time" % ts] = accumulated_waiting_time[i]
+      info["%s_average_speed" % ts] = average_speed[i]
+    info["agents_total_stopped"] = sum(stopped)
+    info["agents_total_accumulated_waiting_time"] = sum(accumulated_waiting_time)
+    return info
@@ -262,21 +262,21 @@ class Network:
     self.tllogics: list[TLLogic] = tllogics
 
   def to_xml(self, indent: int = 0) -> str:
+    return Network.document(indent, [
+      [child.to_xml(indent + 1) for child in children]
+      for children in [self.junction_edges, self.road_edges, self.tllogics, self.junctions, self.via_connections, self.internal_connections]
+    ])
+
+  @staticmethod
+  def document(indent: int, sections: list[list[str]]) -> str:
+    """
+    Wraps already rendered sections (junction edges, road edges, tllogics, junctions, via connections, internal connections) into a net file
+    """
     lines = []
     lines.append(indentation(indent) + '<?xml version="1.0" encoding="UTF-8"?>')
     lines.append(indentation(indent) + '<net version="1.20" junctionCornerDetail="5" limitTurnSpeed="5.50" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:noNamespaceSchemaLocation="http://sumo.dlr.de/xsd/net_file.xsd">')
-    for child in self.junction_edges:
-      lines.append(child.to_xml(indent + 1))
-    for child in self.road_edges:
-      lines.append(child.to_xml(indent + 1))
-    for child in self.tllogics:
-      lines.append(child.to_xml(indent + 1))
-    for child in self.junctions:
-      lines.append(child.to_xml(indent + 1))
-    for child in self.via_connections:
-      lines.append(child.to_xml(indent + 1))
-    for child in self.internal_connections:
-      lines.append(child.to_xml(indent + 1))
+    for section in sections:
+      lines += section
     lines.append('</net>')
     return "\n".join(lines)
 
@@ -476,17 +476,20 @@ def map_of_edges(edges: list[Edge]) -> dict[str, Edge]:
   return {edge.id:edge for edge in edges}
 
 def map_incoming_into_junction_edges(edges: list[Edge]) -> tuple[dict[str, list[str]], dict[str, list[str]]]:
+  return map_incoming_into_junction_lanes([(edge.from_junction, edge.to_junction, [lane.id for lane in edge.lanes]) for edge in edges])
+
+def map_incoming_into_junction_lanes(edges: list[tuple[str, str, list[str]]]) -> tuple[dict[str, list[str]], dict[str, list[str]]]:
   raw_incoming_map: dict[str, dict[str, int]] = {}
   raw_into_map: dict[str, dict[str, int]] = {}
 
-  for edge in edges:
-    if edge.to_junction not in raw_incoming_map:
-      raw_incoming_map[edge.to_junction] = {}
-    if edge.from_junction not in raw_into_map:
-      raw_into_map[edge.from_junction] = {}
-    for lane in edge.lanes:
-      raw_incoming_map[edge.to_junction][lane.id] = 0
-      raw_into_map[edge.from_junction][lane.id] = 0
+  for from_junction, to_junction, lanes in edges:
+    if to_junction not in raw_incoming_map:
+      raw_incoming_map[to_junction] = {}
+    if from_junction not in raw_into_map:
+      raw_into_map[from_junction] = {}
+    for lane in lanes:
+      raw_incoming_map[to_junction][lane] = 0
+      raw_into_map[from_junction][lane] = 0
 
   incoming_map: dict[str, list[str]] = {junction:list(raw_incoming_map[junction].keys()) for junction in raw_incoming_map}
   into_map: dict[str, list[str]] = {junction:list(raw_into_map[junction].keys()) for junction in raw_into_map}
@@ -494,9 +497,11 @@ def map_incoming_into_junction_edges(edges: list[Edge]) -> tuple[dict[str, list[
   return incoming_map, into_map
 
 def map_of_adiacency_of_edges(via_connections: list[ViaConnection]) -> dict[str, dict[str, bool]]:
+  return map_of_adiacency_of_links([(via_connection.from_edge, via_connection.to_edge) for via_connection in via_connections])
+
+def map_of_adiacency_of_links(links: list[tuple[str, str]]) -> dict[str, dict[str, bool]]:
   adiacency: dict[str, dict[str, bool]] = {}
-  for via_connection in via_connections:
-    source, target = via_connection.from_edge, via_connection.to_edge
+  for source, target in links:
     if source not in adiacency:
       adiacency[source] = {}
     adiacency[source][target] = True
@@ -542,9 +547,13 @@ def fix_route(route: list[str], adiacency_map: dict[str, dict[str, bool]]) -> No
 def translate_routes(json_routes: list, network: Network) -> Routes:
   adiacency_map: dict[str, dict[str, bool]] = map_of_adiacency_of_edges(network.via_connections)
   # print(json.dumps(adiacency_map))
+  return translate_routes_over(json_routes, adiacency_map, {})
 
+def translate_routes_over(json_routes: list, adiacency_map: dict[str, dict[str, bool]], route_validity: dict[str, bool]) -> Routes:
+  """
+  route_validity maps route hashes to their already known validity, and is filled with the newly checked ones
+  """
   raw_routes: dict[str, Route] = {}
-  route_validity: dict[str, bool] = {}
   vehicles: list[Vehicle] = []
 
   for json_route in json_routes:
@@ -555,8 +564,9 @@ def translate_routes(json_routes: list, network: Network) -> Routes:
     if route_hash not in raw_routes:
       # Check Route
       edges = json_route['route']
-      if not valid_route(edges, adiacency_map):
-        route_validity[route_hash] = False
+      if route_hash not in route_validity:
+        route_validity[route_hash] = valid_route(edges, adiacency_map)
+      if not route_validity[route_hash]:
         print("WARNING", "Skipping route", edges, "since it is broken")
         continue
       # Add Route
@@ -564,7 +574,6 @@ def translate_routes(json_routes: list, network: Network) -> Routes:
       route_id = Route.name(route_index)
       route = Route(id=route_id, edges=edges)
       raw_routes[route_hash] = route
-      route_validity[route_hash] = True
     route = raw_routes[route_hash]
     # Add Vehicle
     vehicle_index = len(vehicles)
@@ -575,26 +584,186 @@ def translate_routes(json_routes: list, network: Network) -> Routes:
   routes = list(raw_routes.values())
   return Routes(routes=routes, vehicles=vehicles)
 
+# CACHE
+
+def content_hash(content) -> str:
+  return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).digest().hex()
+
+def file_hash(path: str) -> str:
+  with open(path, "rb") as file:
+    return hashlib.sha256(file.read()).digest().hex()
+
+class ConversionCache:
+  """
+  Translations of single roads, intersections and routes from a previous conversion, keyed by the hash of their content.
+  It lives in the output directory next to the files it was used to produce.
+  """
+  VERSION = 1
+
+  def __init__(self, path: str, data: dict) -> None:
+    self.path: str = path
+    self.data: dict = data
+    self.used: dict[str, dict[str, dict]] = {kind: {} for kind in ["roads", "intersections", "routes", "files"]}
+    self.hits: int = 0
+    self.misses: int = 0
+
+  @staticmethod
+  def load(output_dir: str) -> ConversionCache:
+    path = "%s/.cityflow2sumo.cache.json" % (output_dir,)
+    data = {}
+    if os.path.exists(path):
+      with open(path, "r") as file:
+        data = json.load(file)
+      if data.get("version") != ConversionCache.VERSION:
+        data = {}
+    return ConversionCache(path, data)
+
+  def lookup(self, kind: str, key: str, digest: str) -> dict|None:
+    entry = self.data.get(kind, {}).get(key)
+    if entry is None or entry["digest"] != digest:
+      self.misses += 1
+      return None
+    self.hits += 1
+    self.used[kind][key] = entry
+    return entry
+
+  def store(self, kind: str, key: str, digest: str, entry: dict) -> dict:
+    entry["digest"] = digest
+    self.used[kind][key] = entry
+    return entry
+
+  def fresh(self, name: str, digest: str, output_dir: str) -> bool:
+    """
+    Tells whether the output file `name` was already produced from content with the given digest
+    """
+    self.used["files"][name] = {"digest": digest}
+    return self.data.get("files", {}).get(name, {}).get("digest") == digest and os.path.exists("%s/%s" % (output_dir, name))
+
+  def save(self) -> None:
+    # entities that disappeared from the inputs are dropped
+    with open(self.path, "w") as file:
+      json.dump(dict(self.used, version=ConversionCache.VERSION), file)
+
+class NetworkSections:
+  def __init__(self, digest: str, sections: list[list[str]], links: list[tuple[str, str]]) -> None:
+    self.digest: str = digest
+    self.sections: list[list[str]] = sections
+    self.links: list[tuple[str, str]] = links
+
+  def to_xml(self, indent: int = 0) -> str:
+    return Network.document(indent, self.sections)
+
+def translate_network_cached(json_network: dict, cache: ConversionCache) -> NetworkSections:
+  """
+  Same as translate_network, but only translates the roads and intersections whose content changed since the cached conversion,
+  returning the rendered XML sections of the network instead of the Network itself
+  """
+  json_roads = json_network['roads']
+  json_intersections = json_network['intersections']
+  road_index = {json_road['id']: json_road for json_road in json_roads}
+  digests = []
+
+  roads = []
+  for json_road in json_roads:
+    digest = content_hash(json_road)
+    entry = cache.lookup("roads", json_road['id'], digest)
+    if entry is None:
+      edge = translate_road(json_road)
+      entry = cache.store("roads", edge.id, digest, {
+        "xml": edge.to_xml(1),
+        "from": edge.from_junction,
+        "to": edge.to_junction,
+        "lanes": [lane.id for lane in edge.lanes],
+      })
+    roads.append(entry)
+    digests.append(digest)
+  junction_incoming_map, junction_into_map = map_incoming_into_junction_lanes([(road["from"], road["to"], road["lanes"]) for road in roads])
+
+  intersections = []
+  for json_intersection in json_intersections:
+    junction_id = json_intersection['id']
+    if json_intersection['virtual']:
+      digest = content_hash([json_intersection, junction_incoming_map.get(junction_id), junction_into_map.get(junction_id)])
+      entry = cache.lookup("intersections", junction_id, digest)
+      if entry is None:
+        _junction, = translate_virtual_intersection(json_intersection, junction_incoming_map, junction_into_map)
+        entry = cache.store("intersections", junction_id, digest, {
+          "junction_edges": [], "tllogics": [], "junctions": [_junction.to_xml(1)],
+          "via_connections": [], "internal_connections": [], "links": [],
+        })
+    else:
+      referenced_roads = sorted({road_link[end] for road_link in json_intersection['roadLinks'] for end in ['startRoad', 'endRoad']})
+      digest = content_hash([json_intersection, {road: len(road_index[road]['lanes']) for road in referenced_roads}])
+      entry = cache.lookup("intersections", junction_id, digest)
+      if entry is None:
+        edge_map = map_of_edges([translate_road(road_index[road]) for road in referenced_roads])
+        _junction, _via_connections, _internal_connections, _junction_edges, tllogic = translate_tl_intersection(json_intersection, edge_map)
+        entry = cache.store("intersections", junction_id, digest, {
+          "junction_edges": [child.to_xml(1) for child in _junction_edges],
+          "tllogics": [tllogic.to_xml(1)],
+          "junctions": [_junction.to_xml(1)],
+          "via_connections": [child.to_xml(1) for child in _via_connections],
+          "internal_connections": [child.to_xml(1) for child in _internal_connections],
+          "links": [[child.from_edge, child.to_edge] for child in _via_connections],
+        })
+    intersections.append(entry)
+    digests.append(digest)
+
+  sections = [
+    sum([entry["junction_edges"] for entry in intersections], []),
+    [road["xml"] for road in roads],
+    sum([entry["tllogics"] for entry in intersections], []),
+    sum([entry["junctions"] for entry in intersections], []),
+    sum([entry["via_connections"] for entry in intersections], []),
+    sum([entry["internal_connections"] for entry in intersections], []),
+  ]
+  links = [(source, target) for entry in intersections for source, target in entry["links"]]
+  return NetworkSections(content_hash(digests), sections, links)
+
+def translate_routes_cached(json_routes: list, links: list[tuple[str, str]], cache: ConversionCache) -> Routes:
+  """
+  Same as translate_routes, but reuses the validity of the routes already checked against the same edge adiacency
+  """
+  adiacency_digest = content_hash(sorted(links))
+  route_validity: dict[str, bool] = {}
+  for route_hash, entry in cache.data.get("routes", {}).items():
+    if entry["digest"] == adiacency_digest:
+      route_validity[route_hash] = entry["valid"]
+  routes = translate_routes_over(json_routes, map_of_adiacency_of_links(links), route_validity)
+  for route_hash, valid in route_validity.items():
+    cache.store("routes", route_hash, adiacency_digest, {"valid": valid})
+  return routes
+
 if __name__ == "__main__":
   argument_parser = argparse.ArgumentParser("Cityflow2SUMO", description="Converts CityFlow RoadNet/FlowNet format to SUMO XML files")
   argument_parser.add_argument("network_file", type=str, help="Input network file in JSON CityFlow format")
   argument_parser.add_argument("routes_file", type=str, help="Input routes file in JSON CityFlow format")
   argument_parser.add_argument("-o", "--output", type=str, default="./output", help="Output directory for SUMO project")
+  argument_parser.add_argument("--no-cache", action="store_true", default=False, help="Ignore the translations cached in the output directory by a previous conversion")
   cli_args = argument_parser.parse_args(sys.argv[1:])
 
-  json_network = load_network_json(cli_args.network_file)
-  json_routes = load_routes_json(cli_args.routes_file)
-
-  network: Network = translate_network(json_network)
-  routes: Routes = translate_routes(json_routes, network)
-  simulation: Simulation = Simulation(network, routes)
-
   if not os.path.exists(cli_args.output):
     os.makedirs(cli_args.output)
+  cache = ConversionCache.load(cli_args.output)
+  if cli_args.no_cache:
+    cache.data = {}
+
+  json_network = load_network_json(cli_args.network_file)
+  network: NetworkSections = translate_network_cached(json_network, cache)
+  if not cache.fresh("network.net.xml", network.digest, cli_args.output):
+    with open("%s/network.net.xml" % (cli_args.output,), "w") as file:
+      file.write(network.to_xml())
+
+  routes_digest = content_hash([file_hash(cli_args.routes_file), sorted(network.links)])
+  if not cache.fresh("routes.rou.xml", routes_digest, cli_args.output):
+    json_routes = load_routes_json(cli_args.routes_file)
+    routes: Routes = translate_routes_cached(json_routes, network.links, cache)
+    with open("%s/routes.rou.xml" % (cli_args.output,), "w") as file:
+      file.write(routes.to_xml())
+  else:
+    cache.used["routes"] = cache.data.get("routes", {})
 
-  with open("%s/network.net.xml" % (cli_args.output,), "w") as file:
-    file.write(network.to_xml())
-  with open("%s/routes.rou.xml" % (cli_args.output,), "w") as file:
-    file.write(routes.to_xml())
   with open("%s/simulation.sumocfg" % (cli_args.output,), "w") as file:
-    file.write(simulation.to_xml())
+    file.write(Simulation(None, None).to_xml())
+  cache.save()
+  print("Translated %s entities, reused %s from cache" % (cache.misses, cache.hits))
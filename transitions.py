@@ -0,0 +1,126 @@
+import os
+import numpy
+import numpy.lib.format
+
+class TransitionLog:
+  """
+  Fixed capacity ring buffer of (state, action, reward, next_state, done) transitions of a single traffic signal.
+  `done` marks the transitions that ended their episode, such as the ones cut by the gridlock monitor.
+  Records live in a memory-mapped .npy file, the header (transitions written so far, number of actions)
+  lives in a second memory-mapped .npy file next to it, so a log can be reopened and appended to across processes.
+  """
+  HEADER_TOTAL = 0
+  HEADER_ACTIONS = 1
+
+  def __init__(self, path: str, width: int|None = None, n_actions: int|None = None, capacity: int|None = None) -> None:
+    self.path: str = path
+    if os.path.exists(self.data_file()):
+      self.data = numpy.lib.format.open_memmap(self.data_file(), mode="r+")
+      self.header = numpy.lib.format.open_memmap(self.header_file(), mode="r+")
+      if width is not None and self.width() != width:
+        raise ValueError("Transition log %s has states of width %s, got %s" % (path, self.width(), width))
+      if n_actions is not None and self.n_actions() != n_actions:
+        raise ValueError("Transition log %s has %s actions, got %s" % (path, self.n_actions(), n_actions))
+      if capacity is not None and self.capacity() != capacity:
+        raise ValueError("Transition log %s has a capacity of %s, got %s" % (path, self.capacity(), capacity))
+    else:
+      if width is None or n_actions is None or capacity is None:
+        raise FileNotFoundError("Transition log %s does not exist" % path)
+      self.data = numpy.lib.format.open_memmap(self.data_file(), mode="w+", dtype=TransitionLog.dtype(width), shape=(capacity,))
+      self.header = numpy.lib.format.open_memmap(self.header_file(), mode="w+", dtype=numpy.int64, shape=(2,))
+      self.header[TransitionLog.HEADER_ACTIONS] = n_actions
+
+  @staticmethod
+  def dtype(width: int) -> numpy.dtype:
+    return numpy.dtype([
+      ('state', numpy.int16, (width,)),
+      ('action', numpy.int16),
+      ('reward', numpy.float32),
+      ('next_state', numpy.int16, (width,)),
+      ('done', numpy.bool_),
+    ])
+
+  def data_file(self) -> str:
+    return "%s.npy" % self.path
+
+  def header_file(self) -> str:
+    return "%s.header.npy" % self.path
+
+  def width(self) -> int:
+    return self.data.dtype['state'].shape[0]
+
+  def capacity(self) -> int:
+    return self.data.shape[0]
+
+  def n_actions(self) -> int:
+    return int(self.header[TransitionLog.HEADER_ACTIONS])
+
+  def total(self) -> int:
+    return int(self.header[TransitionLog.HEADER_TOTAL])
+
+  def __len__(self) -> int:
+    return min(self.total(), self.capacity())
+
+  def append(self, state: tuple, action: int, reward: float, next_state: tuple, done: bool = False) -> None:
+    index = self.total() % self.capacity()
+    self.data['state'][index] = state
+    self.data['action'][index] = action
+    self.data['reward'][index] = reward
+    self.data['next_state'][index] = next_state
+    self.data['done'][index] = done
+    self.header[TransitionLog.HEADER_TOTAL] += 1
+
+  def transitions(self) -> numpy.ndarray:
+    """
+    Returns the recorded transitions from the oldest to the newest one
+    """
+    if self.total() <= self.capacity():
+      return self.data[:self.total()]
+    head = self.total() % self.capacity()
+    return numpy.concatenate((self.data[head:], self.data[:head]))
+
+  def flush(self) -> None:
+    self.data.flush()
+    self.header.flush()
+
+  def remove(self) -> None:
+    del self.data, self.header
+    os.remove(self.data_file())
+    os.remove(self.header_file())
+
+class TransitionRecorder:
+  """
+  Appends the transitions fed to the learners of every traffic signal to their own TransitionLog.
+  Logs left in `dir` by previous invocations are appended to, unless `fresh` is set, in which case they are removed first.
+  """
+  def __init__(self, dir: str, capacity: int, fresh: bool = False) -> None:
+    self.dir: str = dir
+    self.capacity: int = capacity
+    self.logs: dict[str, TransitionLog] = {}
+    if fresh:
+      remove_logs(dir)
+
+  def log(self, ts: str, width: int, n_actions: int) -> TransitionLog:
+    if ts not in self.logs:
+      self.logs[ts] = TransitionLog(os.path.join(self.dir, ts), width, n_actions, self.capacity)
+    return self.logs[ts]
+
+  def record(self, ts: str, state: tuple, action: int, reward: float, next_state: tuple, n_actions: int, done: bool = False) -> None:
+    self.log(ts, len(state), n_actions).append(state, action, reward, next_state, done)
+
+  def flush(self) -> None:
+    for log in self.logs.values():
+      log.flush()
+
+def list_logs(dir: str) -> list[str]:
+  return sorted([
+    filename[:-len(".npy")]
+    for filename in os.listdir(dir)
+    if filename.endswith(".npy") and not filename.endswith(".header.npy")
+  ])
+
+def remove_logs(dir: str) -> int:
+  logs = list_logs(dir)
+  for ts in logs:
+    TransitionLog(os.path.join(dir, ts)).remove()
+  return len(logs)
@@ -1,11 +1,51 @@
 import os
 import pickle
+import hashlib
 import yaml
+import pandas
+import gymnasium
 
 from sumo_rl import SumoEnvironment
 from sumo_rl.agents import QLAgent
 from sumo_rl.exploration import EpsilonGreedy
 
+from gridlock import GridlockMonitor
+from qtable import CompactQTable
+from subscriptions import CountedSumoEnvironment, SubscribedSumoEnvironment
+from windows import DemandWindows, demand_regimes
+
+SUMMARY_METRICS = [
+  'system_total_stopped',
+  'system_total_waiting_time',
+  'system_mean_waiting_time',
+  'system_mean_speed',
+  'agents_total_stopped',
+  'agents_total_accumulated_waiting_time',
+]
+
+def summarize_metrics(metrics: pandas.DataFrame) -> dict[str, float]:
+  summary = {metric: float(metrics[metric].mean()) for metric in SUMMARY_METRICS if metric in metrics}
+  summary['steps'] = len(metrics)
+  return summary
+
+def learn_terminal(agent: QLAgent, next_state, reward: float) -> None:
+  """
+  Q-learning update of a transition that ends the episode, which QLAgent.learn cannot do as it ignores `done`:
+  the value of `next_state` is not bootstrapped into the target
+  """
+  if next_state not in agent.q_table:
+    agent.q_table[next_state] = [0 for _ in range(agent.action_space.n)]
+  q_values = agent.q_table[agent.state]
+  q_values[agent.action] = q_values[agent.action] + agent.alpha * (reward - q_values[agent.action])
+  agent.state = next_state
+  agent.acc_reward += reward
+
+def experiment_name(mode: str, config_hash: str) -> str:
+  """
+  Path component that keeps apart the outputs of different modes and configs written for the same run and episode
+  """
+  return "%s-%s" % (mode, config_hash[:8])
+
 class SumoConfig:
   def __init__(self, data: dict):
     self.seconds: int = data['seconds']
@@ -13,6 +53,7 @@ class SumoConfig:
     self.delta_time: int = data['delta_time']
     self.use_gui: bool = data['use_gui']
     self.sumo_seed: int = data['sumo_seed']
+    self.subscriptions: bool = data.get('subscriptions', True)
 
 class AgentConfig:
   def __init__(self, data: dict):
@@ -22,26 +63,69 @@ class AgentConfig:
     self.min_epsilon: float = data['min_epsilon']
     self.decay: int = data['decay']
 
+class WindowConfig:
+  def __init__(self, data: dict):
+    self.length: int = data.get('length', 2000)
+    self.offset: int = data.get('offset', 0)
+    self.random_offset: bool = data.get('random_offset', False)
+
 class TrainingConfig:
   def __init__(self, data: dict):
     self.runs: int = data['runs']
     self.episodes: int = data['episodes']
+    self.window: WindowConfig = WindowConfig(data.get('window', {}))
+
+class RecordingConfig:
+  def __init__(self, data: dict):
+    self.capacity: int = data.get('capacity', 1 << 20)
+
+class GridlockConfig:
+  def __init__(self, data: dict):
+    self.window: int = data.get('window', 200)
+    self.tolerance: int = data.get('tolerance', 2)
+    self.min_stopped: int = data.get('min_stopped', 50)
+    self.max_mean_speed: float = data.get('max_mean_speed', 0.5)
+    self.penalty: float = data.get('penalty', -100.0)
+
+class QTableConfig:
+  def __init__(self, data: dict):
+    self.compact: bool = data.get('compact', False)
+    self.bits: int = data.get('bits', 4)
+    self.min_visits: int = data.get('min_visits', 0)
+    self.max_states: int|None = data.get('max_states', None)
+
+class EvaluationConfig:
+  def __init__(self, data: dict):
+    self.cache_size: int = data.get('cache_size', 256)
 
 class Config:
   def __init__(self, data: dict):
     self.sumo: SumoConfig = SumoConfig(data['sumo'])
     self.agent: AgentConfig = AgentConfig(data['agent'])
     self.training: TrainingConfig = TrainingConfig(data['training'])
+    self.recording: RecordingConfig = RecordingConfig(data.get('recording', {}))
+    self.gridlock: GridlockConfig = GridlockConfig(data.get('gridlock', {}))
+    self.q_table: QTableConfig = QTableConfig(data.get('q_table', {}))
+    self.evaluation: EvaluationConfig = EvaluationConfig(data.get('evaluation', {}))
   
   @staticmethod
   def from_file(filepath: str):
     with open(filepath, "r") as file:
       return Config(yaml.load(file, Loader=yaml.Loader))
 
+  @staticmethod
+  def from_file_with_hash(filepath: str) -> tuple['Config', str]:
+    """
+    Loads the config along with the hash of the very bytes it was parsed from
+    """
+    with open(filepath, "rb") as file:
+      data = file.read()
+    return Config(yaml.load(data, Loader=yaml.Loader)), hashlib.sha256(data).hexdigest()
+
 class Scenario:
   def __init__(self, name: str) -> None:
     self.name = name
-    self.config = Config.from_file(self.config_file())
+    self.config, self.config_digest = Config.from_file_with_hash(self.config_file())
 
   def ensure_dir(self, dir: str) -> str:
     if not os.path.exists(dir):
@@ -51,27 +135,48 @@ class Scenario:
   def config_file(self, ) -> str:
     return './scenarios/%s/config.yml' % self.name
 
-  def agents_dir(self, run: int|None, episode: int|None) -> str:
+  def config_hash(self) -> str:
+    """
+    Hash of config.yml as it was when the scenario was loaded, later edits of the file do not change it
+    """
+    return self.config_digest
+
+  def experiment(self, mode: str) -> str:
+    return experiment_name(mode, self.config_hash())
+
+  def catalog_file(self) -> str:
+    return "%s/catalog.sqlite" % self.ensure_dir("./outputs")
+
+  def agents_path(self, run: int|None, episode: int|str|None) -> str:
     if episode is None:
-      return self.ensure_dir("./outputs/%s/agents/%s/final" % (self.name, run))
-    return self.ensure_dir("./outputs/%s/agents/%s/%s" % (self.name, run, episode))
+      episode = "final"
+    return "./outputs/%s/agents/%s/%s/%s" % (self.name, run, self.experiment('QL'), episode)
+
+  def agents_dir(self, run: int|None, episode: int|str|None) -> str:
+    return self.ensure_dir(self.agents_path(run, episode))
 
-  def agents_file(self, run: int|None, episode: int|None, agent: int) -> str:
+  def agents_file(self, run: int|None, episode: int|str|None, agent: int) -> str:
     return "./%s/%s.pickle" % (self.agents_dir(run, episode), agent)
 
-  def metrics_dir(self, run: int) -> str:
-    return self.ensure_dir("./outputs/%s/metrics/%s" % (self.name, run))
+  def metrics_dir(self, run: int, mode: str) -> str:
+    return self.ensure_dir("./outputs/%s/metrics/%s/%s" % (self.name, run, self.experiment(mode)))
+
+  def metrics_file(self, run: int, episode: int, mode: str) -> str:
+    return "./%s/%s.csv" % (self.metrics_dir(run, mode), episode)
 
-  def metrics_file(self, run: int, episode: int) -> str:
-    return "./%s/%s.csv" % (self.metrics_dir(run), episode)
+  def transitions_dir(self, run: int) -> str:
+    return self.ensure_dir("./outputs/%s/transitions/%s" % (self.name, run))
 
-  def plots_dir(self, run: int) -> str:
-    return self.ensure_dir("./outputs/%s/plots/%s" % (self.name, run))
+  def evaluations_dir(self) -> str:
+    return self.ensure_dir("./outputs/%s/cache/evaluations" % self.name)
 
-  def plots_file(self, run: int, episode: int|None) -> str:
+  def plots_dir(self, run: int, experiment: str) -> str:
+    return self.ensure_dir("./outputs/%s/plots/%s/%s" % (self.name, run, experiment))
+
+  def plots_file(self, run: int, experiment: str, episode: int|None) -> str:
     if episode is None:
-      return "./%s/summary.png" % (self.plots_dir(run))
-    return "./%s/%s.png" % (self.plots_dir(run), episode)
+      return "./%s/summary.png" % (self.plots_dir(run, experiment))
+    return "./%s/%s.png" % (self.plots_dir(run, experiment), episode)
 
   def network_file(self) -> str:
     return "./scenarios/%s/network.net.xml" % self.name
@@ -79,8 +184,18 @@ class Scenario:
   def route_file(self) -> str:
     return "./scenarios/%s/routes.rou.xml" % self.name
 
+  def scenario_files(self) -> list[str]:
+    return [self.network_file(), self.route_file(), self.config_file()]
+
+  def checkpoint_files(self, run: int, episode: int|None) -> list[str]:
+    dir = self.agents_path(run, episode)
+    if not os.path.isdir(dir):
+      return []
+    return ["%s/%s" % (dir, filename) for filename in sorted(os.listdir(dir)) if filename.endswith(".pickle")]
+
   def new_sumo_environment(self, fixed_ts: bool = False) -> SumoEnvironment:
-    return SumoEnvironment(
+    environment = SubscribedSumoEnvironment if self.config.sumo.subscriptions else CountedSumoEnvironment
+    return environment(
       net_file=self.network_file(),
       route_file=self.route_file(),
       use_gui=self.config.sumo.use_gui,
@@ -91,11 +206,34 @@ class Scenario:
       fixed_ts=fixed_ts,
     )
 
+  def new_demand_windows(self) -> DemandWindows:
+    return DemandWindows(
+      regimes=demand_regimes(self.route_file()),
+      length=self.config.training.window.length,
+      offset=self.config.training.window.offset,
+      random_offset=self.config.training.window.random_offset,
+      seed=self.config.sumo.sumo_seed,
+    )
+
+  def new_gridlock_monitor(self) -> GridlockMonitor:
+    return GridlockMonitor(
+      window=self.config.gridlock.window,
+      tolerance=self.config.gridlock.tolerance,
+      min_stopped=self.config.gridlock.min_stopped,
+      max_mean_speed=self.config.gridlock.max_mean_speed,
+    )
+
   def new_agent(self, env: SumoEnvironment, agent_id: int, initial_state) -> QLAgent:
-    return QLAgent(
-      starting_state=env.encode(initial_state, agent_id),
-      state_space=env.observation_space,
-      action_space=env.action_space,
+    return self.new_ql_agent(env.encode(initial_state, agent_id), env.observation_space, env.action_space)
+
+  def new_offline_agent(self, starting_state: tuple, n_actions: int) -> QLAgent:
+    return self.new_ql_agent(starting_state, None, gymnasium.spaces.Discrete(n_actions))
+
+  def new_ql_agent(self, starting_state, state_space, action_space) -> QLAgent:
+    agent = QLAgent(
+      starting_state=starting_state,
+      state_space=state_space,
+      action_space=action_space,
       alpha=self.config.agent.alpha,
       gamma=self.config.agent.gamma,
       exploration_strategy=EpsilonGreedy(
@@ -103,18 +241,43 @@ class Scenario:
         min_epsilon=self.config.agent.min_epsilon,
         decay=self.config.agent.decay),
     )
+    if self.config.q_table.compact:
+      agent.q_table = CompactQTable.from_dict(agent.q_table, self.config.q_table.bits)
+    return agent
 
-  def load_agent(self, env: SumoEnvironment, run: int, agent_id: int, initial_state) -> QLAgent:
-    agent = self.new_agent(env, agent_id, initial_state)
-    path = self.agents_file(run, None, agent_id)
+  def load_q_table(self, agent: QLAgent, path: str) -> None:
     with open(path, mode="rb") as file:
       agent.q_table = pickle.load(file)
+    if self.config.q_table.compact and not isinstance(agent.q_table, CompactQTable):
+      agent.q_table = CompactQTable.from_dict(agent.q_table, self.config.q_table.bits)
+    self.ensure_state(agent)
+
+  def ensure_state(self, agent: QLAgent) -> None:
+    """
+    The current state of the agent may be missing from a loaded or pruned q_table
+    """
+    if agent.state not in agent.q_table:
+      agent.q_table[agent.state] = [0 for _ in range(agent.action_space.n)]
+
+  def shrink_q_table(self, agent: QLAgent) -> int:
+    if not isinstance(agent.q_table, CompactQTable):
+      return 0
+    dropped = 0
+    if self.config.q_table.min_visits > 0:
+      dropped += agent.q_table.prune(self.config.q_table.min_visits, keep=(agent.state,))
+    if self.config.q_table.max_states is not None:
+      dropped += agent.q_table.evict(self.config.q_table.max_states, keep=(agent.state,))
+    return dropped
+
+  def load_agent(self, env: SumoEnvironment, run: int, agent_id: int, initial_state, episode: int|None = None) -> QLAgent:
+    agent = self.new_agent(env, agent_id, initial_state)
+    path = self.agents_file(run, episode, agent_id)
+    self.load_q_table(agent, path)
     return agent
 
   def load_or_new_agent(self, env: SumoEnvironment, run: int, agent_id: int, initial_state) -> QLAgent:
     agent = self.new_agent(env, agent_id, initial_state)
     path = self.agents_file(run, None, agent_id)
     if os.path.exists(path):
-      with open(path, mode="rb") as file:
-        agent.q_table = pickle.load(file)
+      self.load_q_table(agent, path)
     return agent
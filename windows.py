@@ -0,0 +1,60 @@
+import random
+import xml.etree.ElementTree
+
+from sumo_rl import SumoEnvironment
+
+class DemandWindow:
+  def __init__(self, regime: int, begin: int, end: int) -> None:
+    self.regime: int = regime
+    self.begin: int = begin
+    self.end: int = end
+
+  def apply(self, env: SumoEnvironment) -> None:
+    """
+    Must be called before env.reset(), which starts SUMO at `begin` and ends the episode at `end`
+    """
+    env.begin_time = self.begin
+    env.sim_max_time = self.end
+
+  def __repr__(self) -> str:
+    return "regime %s [%s, %s]" % (self.regime, self.begin, self.end)
+
+def demand_regimes(route_file: str) -> list[tuple[int, int]]:
+  """
+  Splits the demand profile of a route file into regimes, the maximal time spans covered by overlapping flows
+  """
+  intervals = sorted(
+    (int(float(flow.get('begin', 0))), int(float(flow.get('end'))))
+    for flow in xml.etree.ElementTree.parse(route_file).getroot().iter('flow')
+  )
+  regimes: list[tuple[int, int]] = []
+  for begin, end in intervals:
+    if len(regimes) > 0 and begin < regimes[-1][1]:
+      regimes[-1] = (regimes[-1][0], max(regimes[-1][1], end))
+    else:
+      regimes.append((begin, end))
+  return regimes
+
+class DemandWindows:
+  """
+  Samples a window of `length` seconds per episode, cycling through the demand regimes so that every one of them is trained on.
+  Windows start `offset` seconds into their regime, or at a random point of it if `random_offset` is set.
+  """
+  def __init__(self, regimes: list[tuple[int, int]], length: int, offset: int, random_offset: bool, seed: int) -> None:
+    if len(regimes) == 0:
+      raise ValueError("No demand regimes to sample windows from")
+    self.regimes: list[tuple[int, int]] = regimes
+    self.length: int = length
+    self.offset: int = offset
+    self.random_offset: bool = random_offset
+    self.random: random.Random = random.Random(seed)
+
+  def sample(self, episode: int) -> DemandWindow:
+    regime = episode % len(self.regimes)
+    regime_begin, regime_end = self.regimes[regime]
+    latest_begin = max(regime_begin, regime_end - self.length)
+    if self.random_offset:
+      begin = self.random.randint(regime_begin, latest_begin)
+    else:
+      begin = min(regime_begin + self.offset, latest_begin)
+    return DemandWindow(regime, begin, min(begin + self.length, regime_end))